@@ -1,4 +1,5 @@
 #coding:utf-8
-from .pickleutils import pickle, Picklable, PartiallyPicklable, pickle_dump, pickle_load
+from .pickleutils import (pickle, Picklable, PartiallyPicklable, pickle_dump, pickle_load,
+                          pickle_dump_with_sidecar, pickle_load_with_sidecar)
 
 __version__ = '0.1.1'
@@ -0,0 +1,125 @@
+#coding:utf-8
+import io
+import os
+import gzip
+import bz2
+import lzma
+import threading
+import lz4.block
+import lz4.frame
+from functools import partial
+try:
+    import zstandard as zstd
+except ImportError:
+    zstd = None
+try:
+    import rapidgzip
+except ImportError:
+    rapidgzip = None
+
+LZ4_FRAME_MAGIC = b'\x04"M\x18'
+# gzip payloads at least this large are decompressed in parallel when rapidgzip is installed
+PARALLEL_GZIP_MIN_SIZE = 1 << 24
+CPU_COUNT = os.cpu_count() or 1
+# read buffer for streaming decompressors that lack readline/peek, which pickle and text decoding rely on
+DECOMPRESSION_BUFFER_SIZE = 1 << 20
+
+
+def _lz4_decompress(data, **kw):
+    """lz4 payloads are written in the frame format, but earlier versions used the block format; read either"""
+    if data[:4] == LZ4_FRAME_MAGIC:
+        return lz4.frame.decompress(data, **kw)
+    return lz4.block.decompress(data, **kw)
+
+
+def _gzip_file_compressor(file):
+    return gzip.GzipFile(fileobj=file, mode='wb')
+
+
+def _gzip_file_decompressor(file):
+    return gzip.GzipFile(fileobj=file, mode='rb')
+
+
+def _use_parallel_gzip(size):
+    return CPU_COUNT > 1 and size >= PARALLEL_GZIP_MIN_SIZE
+
+
+if rapidgzip is not None:
+    def _rapidgzip_decompress(data):
+        if not _use_parallel_gzip(len(data)):
+            return gzip.decompress(data)
+        with rapidgzip.open(io.BytesIO(data), parallelization=CPU_COUNT) as f:
+            return f.read()
+
+    def _rapidgzip_file_decompressor(file):
+        # rapidgzip needs random access to the whole file to index the deflate stream
+        if file.seekable() and file.tell() == 0:
+            size = file.seek(0, io.SEEK_END)
+            file.seek(0)
+            if _use_parallel_gzip(size):
+                return rapidgzip.open(file, parallelization=CPU_COUNT)
+        return _gzip_file_decompressor(file)
+
+
+if zstd is not None:
+    # compression contexts are reusable but not thread-safe
+    _zstd_contexts = threading.local()
+
+    def _zstd_compressor(**kw):
+        if kw:
+            return zstd.ZstdCompressor(**kw)
+        cctx = getattr(_zstd_contexts, 'compressor', None)
+        if cctx is None:
+            cctx = _zstd_contexts.compressor = zstd.ZstdCompressor(threads=-1)
+        return cctx
+
+    def _zstd_decompressor(**kw):
+        if kw:
+            return zstd.ZstdDecompressor(**kw)
+        dctx = getattr(_zstd_contexts, 'decompressor', None)
+        if dctx is None:
+            dctx = _zstd_contexts.decompressor = zstd.ZstdDecompressor()
+        return dctx
+
+    def _zstd_compress(data, **kw):
+        return _zstd_compressor(**kw).compress(data)
+
+    def _zstd_decompress(data, **kw):
+        # streamed frames don't record their content size, which the one-shot decompress() requires
+        return _zstd_decompressor(**kw).decompressobj().decompress(data)
+
+    def _zstd_file_compressor(file):
+        return _zstd_compressor().stream_writer(file, closefd=False)
+
+    def _zstd_file_decompressor(file):
+        # the stream reader has no readline or peek
+        reader = _zstd_decompressor().stream_reader(file, closefd=False)
+        return io.BufferedReader(reader, DECOMPRESSION_BUFFER_SIZE)
+
+
+# Callable[[bytes], bytes]
+COMPRESSORS = dict(lzma=lzma.compress, lz4=lz4.frame.compress, bz2=bz2.compress, gzip=gzip.compress)
+DECOMPRESSORS = dict(lzma=lzma.decompress, lz4=_lz4_decompress, bz2=bz2.decompress, gzip=gzip.decompress)
+# Callable[[FileIO], FileIO]; wrap an open binary file for streaming (de)compression, so that file dumps/loads
+# needn't hold the whole payload in memory. These must not close the underlying file when closed.
+FILE_COMPRESSORS = dict(lzma=partial(lzma.LZMAFile, mode='wb'), lz4=partial(lz4.frame.LZ4FrameFile, mode='wb'),
+                        bz2=partial(bz2.BZ2File, mode='wb'), gzip=_gzip_file_compressor)
+# lz4 is absent here since files in the legacy block format can't be read by a frame reader
+FILE_DECOMPRESSORS = dict(lzma=partial(lzma.LZMAFile, mode='rb'), bz2=partial(bz2.BZ2File, mode='rb'),
+                          gzip=_gzip_file_decompressor)
+COMPRESSION_EXTENSIONS = dict(lzma='.lzma', lz4='.lz4', bz2='.bz2', gzip='.gzip')
+
+if zstd is not None:
+    COMPRESSION_EXTENSIONS["zstd"] = ".zst"
+    COMPRESSORS["zstd"] = _zstd_compress
+    DECOMPRESSORS["zstd"] = _zstd_decompress
+    FILE_COMPRESSORS["zstd"] = _zstd_file_compressor
+    FILE_DECOMPRESSORS["zstd"] = _zstd_file_decompressor
+else:
+    del zstd
+
+if rapidgzip is not None:
+    DECOMPRESSORS["gzip"] = _rapidgzip_decompress
+    FILE_DECOMPRESSORS["gzip"] = _rapidgzip_file_decompressor
+else:
+    del rapidgzip
@@ -3,44 +3,233 @@ from typing import Union, Callable, Iterable, Iterator, Dict, Tuple, Optional as
 import io
 import os
 import re
+import sys
 import codecs
 import ujson as json
 import base64
+import string
 import pickle
-import gzip
-import bz2
-import lzma
+import struct
 import msgpack
-import lz4.block
 from pathlib import Path
-from operator import itemgetter
+from operator import itemgetter, methodcaller
 from itertools import starmap
 from functools import partial, lru_cache
-from collections import ChainMap
-from cytoolz import compose, flip
+from collections import ChainMap, deque
+from concurrent.futures import ThreadPoolExecutor
 from logging import getLogger
+from .pickleutils import pickle_dump, pickle_load
+from .compression import (COMPRESSORS, DECOMPRESSORS, FILE_COMPRESSORS, FILE_DECOMPRESSORS,
+                          COMPRESSION_EXTENSIONS)
 try:
     import dill
 except ImportError:
     dill = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 NoneType = type(None)
 logger = getLogger(__name__)
 DEFAULT_TEXT_ENCODING = "utf-8"
+# buffer size for files opened by FlexiblePersist; larger than io.DEFAULT_BUFFER_SIZE to cut down on syscalls and
+# feed (de)compressors in bigger chunks
+DEFAULT_IO_BUFFER_SIZE = 1 << 20
 PATH_TYPES = (str, Path)
 # this will default to True in the future, allowing strings to unpack to unicode directly by default
 MSGPACK_LOAD_KW = dict(raw=False)
+MSGPACK_DUMP_KW = dict(use_bin_type=True)
+# msgpack extension type code for numpy arrays; the payload is the length of the dtype string and ndim as uint8's,
+# the shape as little-endian int64's, the dtype string, and the raw C-ordered array data
+MSGPACK_NDARRAY_EXT = 1
+# shards dumped to a directory are serialized on the calling thread and written by this many background threads,
+# with at most DIR_WRITER_MAX_PENDING serialized shards held in memory awaiting a write
+DIR_WRITER_THREADS = 4
+DIR_WRITER_MAX_PENDING = 8
+# number of out-of-band buffers in a framed protocol-5 pickle; followed by the lengths of the pickle stream and each
+# buffer as little-endian uint64's, then the pickle stream and the buffers themselves
+PICKLE5_HEADER = struct.Struct('<I')
+
+
+if orjson is not None:
+    # orjson is substantially faster than ujson, but its output differs (NaN and inf are written as null and ints
+    # wider than 64 bits are rejected), so it's registered as a separate serialization rather than backing 'json'.
+    # Non-str keys are allowed by default for parity with ujson, which coerces them to strings. orjson works in
+    # UTF-8 bytes, so it's registered as a binary serialization to avoid a needless decode/encode round trip
+    _orjson_dumps = partial(orjson.dumps, option=orjson.OPT_NON_STR_KEYS)
+
+    def _orjson_dump(obj, file, option=orjson.OPT_NON_STR_KEYS, **kw):
+        file.write(orjson.dumps(obj, option=option, **kw))
+
+    def _orjson_load(file):
+        return orjson.loads(file.read())
+
+
+if pickle.HIGHEST_PROTOCOL >= 5:
+    def _pickle5_dumps_oob(obj, **kw):
+        buffers = []
+
+        def buffer_callback(buf):
+            try:
+                buffers.append(buf.raw())
+            except BufferError:
+                # not contiguous; serialize in-band
+                return True
+            return False
+
+        data = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback, **kw)
+        header = PICKLE5_HEADER.pack(len(buffers)) + \
+            struct.pack('<{}Q'.format(len(buffers) + 1), len(data), *(b.nbytes for b in buffers))
+        return [header, data, *buffers]
+
+    def _pickle5_dumps(obj, **kw):
+        return b''.join(_pickle5_dumps_oob(obj, **kw))
+
+    def _pickle5_dump(obj, file, **kw):
+        # the buffers go straight to the file without being copied into the pickle stream
+        for chunk in _pickle5_dumps_oob(obj, **kw):
+            file.write(chunk)
+
+    def _pickle5_loads(data, **kw):
+        """out-of-band buffers are reconstructed as views into data without copying, so e.g. numpy arrays loaded
+        from immutable bytes will be read-only"""
+        data = memoryview(data)
+        n, = PICKLE5_HEADER.unpack_from(data)
+        lengths = struct.unpack_from('<{}Q'.format(n + 1), data, PICKLE5_HEADER.size)
+        offset = PICKLE5_HEADER.size + 8 * (n + 1)
+        segments = []
+        for length in lengths:
+            segments.append(data[offset:offset + length])
+            offset += length
+        return pickle.loads(segments[0], buffers=segments[1:], **kw)
+
+    def _pickle5_load(file, **kw):
+        n, = PICKLE5_HEADER.unpack(_read_exactly(file, PICKLE5_HEADER.size))
+        lengths = struct.unpack('<{}Q'.format(n + 1), _read_exactly(file, 8 * (n + 1)))
+        data = _read_exactly(file, lengths[0])
+        buffers = [_read_exactly(file, length) for length in lengths[1:]]
+        return pickle.loads(data, buffers=buffers, **kw)
+
+
+def _msgpack_default(obj):
+    # numpy is never imported here just to check; if it hasn't been imported, obj can't be an array. This keeps
+    # numpy's import cost out of the startup of processes that never use it
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(obj, numpy.ndarray) and not obj.dtype.hasobject:
+        if obj.dtype.fields is not None:
+            # the dtype string of a structured array is a bare void type; field names and types would be lost
+            raise TypeError("can not serialize structured array with dtype {}".format(obj.dtype))
+        if not obj.flags.c_contiguous:
+            obj = obj.copy(order='C')
+        dtype = obj.dtype.str.encode()
+        header = struct.pack('<BB{}q'.format(obj.ndim), len(dtype), obj.ndim, *obj.shape)
+        # a flat byte view of the array, so the data is copied only once, into the extension payload
+        data = memoryview(obj.reshape(-1).view(numpy.uint8))
+        return msgpack.ExtType(MSGPACK_NDARRAY_EXT, b''.join((header, dtype, data)))
+    raise TypeError("can not serialize {!r} object".format(type(obj).__name__))
+
+
+def _msgpack_ext_hook(code, data):
+    """arrays are views into the msgpack payload rather than copies, and so are read-only"""
+    if code != MSGPACK_NDARRAY_EXT:
+        return msgpack.ExtType(code, data)
+    try:
+        import numpy
+    except ImportError:
+        return msgpack.ExtType(code, data)
+    dtype_len, ndim = struct.unpack_from('<BB', data)
+    shape = struct.unpack_from('<{}q'.format(ndim), data, 2)
+    offset = 2 + 8 * ndim
+    dtype = data[offset:offset + dtype_len].decode()
+    return numpy.frombuffer(data, dtype=dtype, offset=offset + dtype_len).reshape(shape)
+
+
+MSGPACK_DUMP_KW.update(default=_msgpack_default)
+MSGPACK_LOAD_KW.update(ext_hook=_msgpack_ext_hook)
+
+
+def _read_exactly(file, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    pos = 0
+    while pos < n:
+        k = file.readinto(view[pos:])
+        if not k:
+            raise EOFError("expected {} bytes; got {}".format(n, pos))
+        pos += k
+    return buf
 
 
 def _maybe_add_extension(path, extension):
-    if isinstance(path, Path):
-        path = str(path)
+    path = os.fspath(path)
     _, ext = os.path.splitext(path)
     if not ext:
         path = path + extension
     return path
 
 
+@lru_cache(None)
+def _fused_factory(n):
+    """generate a factory for the composition of n unary functions as a single nested call expression, so that a
+    compiled pipeline runs in one frame, with every stage a closure variable"""
+    names = ['f{}'.format(i) for i in range(n)]
+    source = ("def make({args}):\n"
+              "    def fused(x):\n"
+              "        return {call}(x{close}\n"
+              "    return fused\n").format(args=', '.join(names), call='('.join(names), close=')' * n)
+    namespace = {}
+    exec(source, namespace)
+    return namespace['make']
+
+
+def _fuse(fs):
+    """compose a sequence of functions, applying the last first"""
+    fs = tuple(fs)
+    if len(fs) == 1:
+        return fs[0]
+    return _fused_factory(len(fs))(*fs)
+
+
+@lru_cache(128)
+def _dir_pattern(prefix, pattern, ext):
+    return re.compile(re.escape(prefix) + r"(?P<k>{})".format(pattern) + re.escape(ext))
+
+
+# the key patterns used by FlexiblePersist's own directory loaders, matched with plain string ops
+_DIR_KEY_CHECKS = {
+    # str.isdigit alone admits non-ASCII digits, which [0-9] doesn't
+    r'[0-9]+': lambda k: bool(k) and all(c in string.digits for c in k),
+    r'.*': lambda k: '\n' not in k,
+}
+
+
+def _dir_keys(names, prefix, pattern, ext):
+    """Iterator of (key, name) for the names of the form prefix + key + ext where key matches pattern"""
+    check = _DIR_KEY_CHECKS.get(pattern)
+    if check is None:
+        for m in filter(None, map(_dir_pattern(prefix, pattern, ext).fullmatch, names)):
+            yield m.group('k'), m.group()
+        return
+
+    start, min_len = len(prefix), len(prefix) + len(ext)
+    for name in names:
+        if len(name) >= min_len and name.startswith(prefix) and name.endswith(ext):
+            key = name[start:len(name) - len(ext)]
+            if check(key):
+                yield key, name
+
+
+@lru_cache(None)
+def _is_ascii_compatible(char_encoding):
+    return string.printable.encode(char_encoding) == string.printable.encode('ascii')
+
+
+def _write_file(path, data, mode, buffering=-1):
+    with open(path, mode, buffering=buffering) as f:
+        f.write(data)
+
+
 def ensure_dir(dir_):
     if os.path.exists(dir_):
         if not os.path.isdir(dir_):
@@ -65,7 +254,6 @@ class StreamSerializer:
 
 class StreamDeserializer:
     def __init__(self, deser):
-        print
         """turn a Callable[[AnyStr], obj] into a Callable[[FileIO], obj]"""
         self.deserializer = deser
 
@@ -74,6 +262,41 @@ class StreamDeserializer:
         return self.deserializer(s)
 
 
+class CompressedStreamSerializer:
+    def __init__(self, ser, compressor, encoding=None):
+        """turn an effectful Callable[[obj, FileIO], NoneType] into one that writes through a streaming compressor,
+        specified as a Callable[[FileIO], FileIO] wrapping a binary file for writing. When encoding is given, the
+        serializer is assumed to write str and the compressed stream is wrapped for text."""
+        self.serializer = ser
+        self.compressor = compressor
+        self.encoding = encoding
+
+    def __call__(self, obj, file):
+        with self.compressor(file) as f:
+            if self.encoding is None:
+                self.serializer(obj, f)
+            else:
+                with io.TextIOWrapper(f, encoding=self.encoding) as t:
+                    self.serializer(obj, t)
+
+
+class CompressedStreamDeserializer:
+    def __init__(self, deser, decompressor, encoding=None):
+        """turn a Callable[[FileIO], obj] into one that reads through a streaming decompressor, specified as a
+        Callable[[FileIO], FileIO] wrapping a binary file for reading. When encoding is given, the deserializer is
+        assumed to read str and the decompressed stream is wrapped for text."""
+        self.deserializer = deser
+        self.decompressor = decompressor
+        self.encoding = encoding
+
+    def __call__(self, file):
+        with self.decompressor(file) as f:
+            if self.encoding is None:
+                return self.deserializer(f)
+            with io.TextIOWrapper(f, encoding=self.encoding) as t:
+                return self.deserializer(t)
+
+
 class StrSerializer:
     def __init__(self, ser, binary=True):
         """turn an effectful Callable[[obj, FileIO], NoneType] into a Callable[[obj], AnyStr]"""
@@ -83,8 +306,7 @@ class StrSerializer:
     def __call__(self, obj):
         with self._io_cls() as f:
             self.serializer(obj, f)
-            f.seek(0)
-            return f.read()
+            return f.getvalue()
 
 
 class StrDeserializer:
@@ -94,25 +316,25 @@ class StrDeserializer:
         self._io_cls = io.BytesIO if binary else io.StringIO
 
     def __call__(self, s):
-        with self._io_cls() as f:
-            f.write(s)
-            f.seek(0)
+        with self._io_cls(s) as f:
             return self.deserializer(f)
 
 
 class IORegistry:
-    _dumpers = dict(pickle=pickle.dumps, msgpack=msgpack.dumps)
+    _dumpers = dict(pickle=pickle.dumps, msgpack=partial(msgpack.dumps, **MSGPACK_DUMP_KW))
     _loaders = dict(pickle=pickle.loads, msgpack=partial(msgpack.loads, **MSGPACK_LOAD_KW))
-    _file_dumpers = dict(pickle=pickle.dump, msgpack=msgpack.dump)
-    _file_loaders = dict(pickle=pickle.load, msgpack=partial(msgpack.load, **MSGPACK_LOAD_KW))
+    _file_dumpers = dict(pickle=pickle_dump, msgpack=partial(msgpack.dump, **MSGPACK_DUMP_KW))
+    _file_loaders = dict(pickle=pickle_load, msgpack=partial(msgpack.load, **MSGPACK_LOAD_KW))
 
     _text_dumpers = dict(json=json.dumps)
     _text_loaders = dict(json=json.loads)
     _text_file_dumpers = dict(json=json.dump)
     _text_file_loaders = dict(json=json.load)
 
-    _compressors = dict(lzma=lzma.compress, lz4=lz4.block.compress, bz2=bz2.compress, gzip=gzip.compress)
-    _decompressors = dict(lzma=lzma.decompress, lz4=lz4.block.decompress, bz2=bz2.decompress, gzip=gzip.decompress)
+    _compressors = COMPRESSORS
+    _decompressors = DECOMPRESSORS
+    _file_compressors = FILE_COMPRESSORS
+    _file_decompressors = FILE_DECOMPRESSORS
 
     _text_decoders = dict(
         base16=base64.b16decode,
@@ -127,30 +349,39 @@ class IORegistry:
         base85=base64.b85encode,
     )
 
-    _compression_extensions = dict(lzma='.lzma', lz4='.lz4', bz2='.bz2', gzip='.gzip')
+    _compression_extensions = COMPRESSION_EXTENSIONS
     _serialization_extensions = dict(json='.json', pickle='.pkl', msgpack='.msgpack')
     _text_extensions = dict(base16='.b16', base32='.b32', base64='.b64', base85='.b85')
+    # text encoders whose output is pure ASCII, and whose decoders accept ASCII str as well as bytes
+    _ascii_text_encoders = frozenset(('base16', 'base32', 'base64', 'base85'))
     _text_extension = '.txt'
     _char_encoding = DEFAULT_TEXT_ENCODING
 
     dumpers = loaders = file_dumpers = file_loaders = None
     text_dumpers = text_loaders = text_file_dumpers = text_file_loaders = None
-    compressors = decompressors = text_encoders = text_decoders = None
+    compressors = decompressors = file_compressors = file_decompressors = text_encoders = text_decoders = None
     compression_extensions = serialization_extensions = text_extensions = None
     text_encoders_return_str = None
 
+    # each of these is backed by a class-level dict of the same name prefixed with '_'
+    _registry_attrs = ('dumpers', 'loaders', 'file_dumpers', 'file_loaders',
+                       'text_dumpers', 'text_loaders', 'text_file_dumpers', 'text_file_loaders',
+                       'text_encoders', 'text_decoders', 'compressors', 'decompressors',
+                       'file_compressors', 'file_decompressors',
+                       'compression_extensions', 'serialization_extensions', 'text_extensions',
+                       )
+
     def __init__(self, char_encoding: str=DEFAULT_TEXT_ENCODING):
-        for attr in ('dumpers', 'loaders', 'file_dumpers', 'file_loaders',
-                     'text_dumpers', 'text_loaders', 'text_file_dumpers', 'text_file_loaders',
-                     'text_encoders', 'text_decoders', 'compressors', 'decompressors',
-                     'compression_extensions', 'serialization_extensions', 'text_extensions',
-                     ):
+        for attr in self._registry_attrs:
             # so subclasses can share without overwriting upon registry
             setattr(self, attr, ChainMap({}, getattr(self, '_' + attr)))
 
-            self.text_encoders_return_str = set()
+        self.text_encoders_return_str = set()
 
-            self.char_encoding = char_encoding
+        self.char_encoding = char_encoding
+
+        # extension -> name lookups; built lazily and discarded whenever a new extension is registered
+        self._reverse_extensions = {}
 
     @property
     def char_encoding(self):
@@ -163,28 +394,41 @@ class IORegistry:
         except LookupError as e:
             raise e
         self._char_encoding = char_encoding
+        # built once here rather than on every access; these are used in every compiled text pipeline
+        self._bytes_to_str = methodcaller('decode', char_encoding)
+        self._str_to_bytes = methodcaller('encode', char_encoding)
 
     @property
     def bytes_to_str_default(self):
-        return partial(flip(bytes.decode), self.char_encoding)
+        return self._bytes_to_str
 
     @property
     def str_to_bytes_default(self):
-        return partial(flip(str.encode), self.char_encoding)
+        return self._str_to_bytes
 
     def register_compressor(self, name, *,
                             compressor: Callable[[bytes], bytes],
                             decompressor: Callable[[bytes], bytes],
-                            extension: str):
+                            extension: str,
+                            file_compressor: Opt[Callable[[io.IOBase], io.IOBase]]=None,
+                            file_decompressor: Opt[Callable[[io.IOBase], io.IOBase]]=None):
         if name in self.compressors or name in self.decompressors:
             raise KeyError("{} is already registered; choose a different name".format(name))
         for alias, f in [("compressor", compressor), ("decompressor", decompressor)]:
             if not callable(f):
                 raise TypeError("{} must be callable; got {}".format(alias, type(f)))
+        for alias, f in [("file_compressor", file_compressor), ("file_decompressor", file_decompressor)]:
+            if f is not None and not callable(f):
+                raise TypeError("{} must be callable if passed; got {}".format(alias, type(f)))
 
         self.compressors[name] = compressor
         self.decompressors[name] = decompressor
+        if file_compressor is not None:
+            self.file_compressors[name] = file_compressor
+        if file_decompressor is not None:
+            self.file_decompressors[name] = file_decompressor
         self.compression_extensions[name] = '.' + extension.lstrip('.')
+        self._reverse_extensions.clear()
 
     def register_text_encoder(self, name, *,
                               extension: str,
@@ -203,6 +447,7 @@ class IORegistry:
         self.text_encoders[name] = encoder
         self.text_decoders[name] = decoder
         self.text_extensions[name] = '.' + extension.lstrip('.')
+        self._reverse_extensions.clear()
 
     def register_serializer(self, name: str, *,
                             extension: str,
@@ -219,16 +464,18 @@ class IORegistry:
         if name in loaders or name in dumpers:
             raise KeyError("{} is already registered; choose a different name".format(name))
 
-        for alias, f in [("serializer", serializer),
-                         ("stream_serializer", stream_serializer),
-                         ("deserializer", deserializer),
-                         ("stream_deserializer", stream_serializer)]:
-            if not callable(f):
-                raise TypeError("{} must be callable; got {}".format(alias, type(f)))
+        for alias, f, stream_alias, stream_f in [
+                ("serializer", serializer, "stream_serializer", stream_serializer),
+                ("deserializer", deserializer, "stream_deserializer", stream_deserializer)]:
+            if f is None and stream_f is None:
+                raise TypeError("at least one of {} or {} must be passed".format(alias, stream_alias))
+            for alias_, f_ in [(alias, f), (stream_alias, stream_f)]:
+                if f_ is not None and not callable(f_):
+                    raise TypeError("{} must be callable; got {}".format(alias_, type(f_)))
 
-        ser = serializer or StrSerializer(serializer, binary)
+        ser = serializer or StrSerializer(stream_serializer, binary)
         stream_ser = stream_serializer or StreamSerializer(serializer)
-        deser = deserializer or StrDeserializer(deserializer, binary)
+        deser = deserializer or StrDeserializer(stream_deserializer, binary)
         stream_deser = stream_deserializer or StreamDeserializer(deserializer)
 
         dumpers[name] = ser
@@ -236,6 +483,7 @@ class IORegistry:
         file_dumpers[name] = stream_ser
         file_loaders[name] = stream_deser
         self.serialization_extensions[name] = '.' + extension.lstrip('.')
+        self._reverse_extensions.clear()
 
     def is_binary_serialization(self, serialization):
         if serialization in self.loaders:
@@ -254,11 +502,11 @@ class IORegistry:
             raise KeyError("Unknown text encoding protocol: {}".format(encoding))
 
     def get_serializer(self, serialization: str, string=False):
-        registry = self._dumpers if string else self._file_dumpers
+        registry = self.dumpers if string else self.file_dumpers
         return self._get_lambda(serialization, registry, "serialization")
 
     def get_deserializer(self, serialization: str, string=False):
-        registry = self._dumpers if string else self._file_dumpers
+        registry = self.loaders if string else self.file_loaders
         return self._get_lambda(serialization, registry, "serialization")
 
     def serialization_from_extension(self, ext: str):
@@ -271,7 +519,9 @@ class IORegistry:
         return self._name_from_ext(ext, self.text_extensions, "text extension")
 
     def _name_from_ext(self, ext, dict_, kwarg):
-        rev = dict(map(reversed, dict_.items()))
+        rev = self._reverse_extensions.get(id(dict_))
+        if rev is None:
+            rev = self._reverse_extensions[id(dict_)] = dict(map(reversed, dict_.items()))
         ext = '.' + ext.lstrip('.')
         return self._get_lambda(ext, rev, kwarg)
 
@@ -308,30 +558,57 @@ class IORegistry:
 
         return serialization, compression, text_encoding
 
+    # registered names can't be re-registered, so these lookups are safe to memoize; misses raise and aren't cached
+    @lru_cache(None)
     def get_serializer_pairs(self, serialization: str):
         return (self._get_lambda(serialization, self.dumpers, "serialization"),
                 self._get_lambda(serialization, self.loaders, "serialization"),
                 self._get_lambda(serialization, self.file_dumpers, "serialization"),
                 self._get_lambda(serialization, self.file_loaders, "serialization"))
 
+    @lru_cache(None)
     def get_text_serializer_pairs(self, serialization: str):
         return (self._get_lambda(serialization, self.text_dumpers, "serialization"),
                 self._get_lambda(serialization, self.text_loaders, "serialization"),
                 self._get_lambda(serialization, self.text_file_dumpers, "serialization"),
                 self._get_lambda(serialization, self.text_file_loaders, "serialization"))
 
+    @lru_cache(None)
     def get_compressor_pair(self, compression: str):
         return (self._get_lambda(compression, self.compressors, "compression"),
                 self._get_lambda(compression, self.decompressors, "compression"))
 
+    def get_file_compressor_pair(self, compression: str):
+        return (self._get_lambda(compression, self.file_compressors, "compression", allow_missing=True),
+                self._get_lambda(compression, self.file_decompressors, "compression", allow_missing=True))
+
     def get_text_encoder_pair(self, conversion: str):
+        return self._get_text_encoder_pair(conversion, self.char_encoding)
+
+    @lru_cache(None)
+    def _get_text_encoder_pair(self, conversion: str, char_encoding: str):
+        # char_encoding is only part of the cache key; the converters below are those built for it by the setter
         encoder, decoder = (self._get_lambda(conversion, self.text_encoders, "conversion"),
                             self._get_lambda(conversion, self.text_decoders, "conversion"))
-        if conversion not in self.text_encoders_return_str:
-            encoder = compose(self.bytes_to_str_default, encoder)
-            decoder = compose(decoder, self.str_to_bytes_default)
+        if conversion in self.text_encoders_return_str:
+            return encoder, decoder
 
-        return encoder, decoder
+        if conversion in self._ascii_text_encoders and _is_ascii_compatible(char_encoding):
+            # ASCII decoding is a fast path in CPython, and the decoders take the str as-is
+            def encode(b):
+                return encoder(b).decode('ascii')
+
+            return encode, decoder
+
+        to_str, to_bytes = self._bytes_to_str, self._str_to_bytes
+
+        def encode(b):
+            return to_str(encoder(b))
+
+        def decode(s):
+            return decoder(to_bytes(s))
+
+        return encode, decode
 
     @staticmethod
     def _get_lambda(key, dict_, kwarg, allow_missing=False):
@@ -340,6 +617,9 @@ class IORegistry:
             raise ValueError("{} must be one of {}; got {}".format(kwarg, tuple(dict_), key))
         return lam
 
+    # memoized per process only. Persisting the memo to disk to speed up worker startup doesn't pay: compiled
+    # pipelines are closures over registry callables, which can't be pickled, and rebuilding one from its cached
+    # arguments costs the same few microseconds as compiling it
     @lru_cache(None)
     def compile_pipeline(self, serialization: str, *,
                          compression: Opt[str]=None,
@@ -374,17 +654,26 @@ class IORegistry:
 
         # bytes -> bytes
         if compression is not None:
-            # can't write direct to file now
-            to_file_fs, from_file_fs = None, None
             file_mode = 'b'
 
             compress, decompress = self.get_compressor_pair(compression)
+            file_compress, file_decompress = self.get_file_compressor_pair(compression)
 
+            # the streaming wrappers don't necessarily share a signature with the one-shot (de)compressors
             if compress_kw:
                 compress = partial(compress, **compress_kw)
+                file_compress = None
 
             if decompress_kw:
                 decompress = partial(decompress, **decompress_kw)
+                file_decompress = None
+
+            # stream direct to file through the compressor where possible; otherwise buffer the whole payload
+            encoding = None if binary else self.char_encoding
+            to_file_fs = None if file_compress is None else \
+                [CompressedStreamSerializer(to_file, file_compress, encoding)]
+            from_file_fs = None if file_decompress is None else \
+                [CompressedStreamDeserializer(from_file, file_decompress, encoding)]
 
             if not binary:
                 to_str_fs.append(self.str_to_bytes_default)
@@ -409,15 +698,17 @@ class IORegistry:
 
         # reverse the composition
         to_str_fs = reversed(to_str_fs)
-        to_str = compose(*to_str_fs)
-        from_str = compose(*from_str_fs)
+        to_str = _fuse(to_str_fs)
+        from_str = _fuse(from_str_fs)
 
         if to_file_fs:
-            to_file_fs = reversed(to_file_fs)
-            to_file = compose(*to_file_fs)
-            from_file = compose(*from_file_fs)
+            to_file = _fuse(reversed(to_file_fs))
         else:
             to_file = StreamSerializer(to_str)
+
+        if from_file_fs:
+            from_file = _fuse(from_file_fs)
+        else:
             from_file = StreamDeserializer(from_str)
 
         return to_str, from_str, to_file, from_file, file_mode
@@ -432,6 +723,22 @@ if dill is not None:
 else:
     del dill
 
+if orjson is not None:
+    IORegistry._serialization_extensions["orjson"] = ".orjson"
+    IORegistry._loaders["orjson"] = orjson.loads
+    IORegistry._dumpers["orjson"] = _orjson_dumps
+    IORegistry._file_loaders["orjson"] = _orjson_load
+    IORegistry._file_dumpers["orjson"] = _orjson_dump
+else:
+    del orjson
+
+if pickle.HIGHEST_PROTOCOL >= 5:
+    IORegistry._serialization_extensions["pickle5"] = ".pkl5"
+    IORegistry._loaders["pickle5"] = _pickle5_loads
+    IORegistry._dumpers["pickle5"] = _pickle5_dumps
+    IORegistry._file_loaders["pickle5"] = _pickle5_load
+    IORegistry._file_dumpers["pickle5"] = _pickle5_dump
+
 DefaultIORegistry = IORegistry()
 
 
@@ -444,6 +751,7 @@ class FlexiblePersist:
                  compress_kw: Opt[Dict[str, object]]=None,
                  decompress_kw: Opt[Dict[str, object]]=None,
                  always_use_text_encoding: bool=False,
+                 io_buffer_size: int=DEFAULT_IO_BUFFER_SIZE,
                  _io_registry=DefaultIORegistry):
         if always_use_text_encoding:
             if text_encoding is None:
@@ -487,6 +795,7 @@ class FlexiblePersist:
         self._compress_kw = compress_kw
         self._decompress_kw = decompress_kw
         self._always_use_text_encoding = always_use_text_encoding
+        self._io_buffer_size = io_buffer_size
         self._dump = to_file
         self._load = from_file
         self.dumps = to_str
@@ -503,14 +812,16 @@ class FlexiblePersist:
     def from_extension(cls, ext: str, dump_kw: Opt[Dict[str, object]]=None,
                  load_kw: Opt[Dict[str, object]]=None,
                  compress_kw: Opt[Dict[str, object]]=None,
-                 decompress_kw: Opt[Dict[str, object]]=None, _io_registry=DefaultIORegistry):
+                 decompress_kw: Opt[Dict[str, object]]=None,
+                 _io_registry=DefaultIORegistry, *,
+                 io_buffer_size: int=DEFAULT_IO_BUFFER_SIZE):
         serialization, compression, text_encoding = _io_registry.pipeline_from_extension(ext)
 
         return cls(serialization=serialization, compression=compression, text_encoding=text_encoding,
                    always_use_text_encoding=text_encoding is not None,
                    dump_kw=dump_kw, load_kw=load_kw,
                    compress_kw=compress_kw, decompress_kw=decompress_kw,
-                   _io_registry=_io_registry)
+                   io_buffer_size=io_buffer_size, _io_registry=_io_registry)
 
     def __str__(self):
         attrs = ((k, getattr(self, k, None))
@@ -567,7 +878,7 @@ class FlexiblePersist:
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self.extension)
-            with open(file, 'w' + self._mode) as f:
+            with open(file, 'w' + self._mode, buffering=self._io_buffer_size) as f:
                 self._dump(obj, f)
         else:
             self._dump(obj, file)
@@ -576,7 +887,7 @@ class FlexiblePersist:
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self.extension)
-            with open(file, 'r' + self._mode) as f:
+            with open(file, 'r' + self._mode, buffering=self._io_buffer_size) as f:
                 return self._load(f)
         else:
             return self._load(file)
@@ -591,12 +902,20 @@ class FlexiblePersist:
 
     def _dump_stream_to_dir(self, items: Iterable[object], dir_: str, prefix: str=""):
         ensure_dir(dir_)
-        ext = self.extension
-        prefix = os.path.join(dir_, prefix)
-        template = prefix + '{}' + ext
-        for k, v in items:
-            with open(template.format(k), 'w' + self._mode) as outfile:
-                self._dump(v, outfile)
+        # names are built directly from the template; no need for per-file extension handling
+        path = (os.path.join(dir_, prefix) + '{}' + self.extension).format
+        dumps, mode, buffering = self.dumps, 'w' + self._mode, self._io_buffer_size
+        # serialization is CPU-bound and holds the GIL, while writes release it, so the two overlap
+        pending = deque()
+        with ThreadPoolExecutor(DIR_WRITER_THREADS) as executor:
+            for k, v in items:
+                data = dumps(v)
+                if len(pending) >= DIR_WRITER_MAX_PENDING:
+                    # bounds memory, and surfaces write errors early
+                    pending.popleft().result()
+                pending.append(executor.submit(_write_file, path(k), data, mode, buffering))
+            for future in pending:
+                future.result()
 
     def dump_stream_to_dir(self, iterable: Iterable[object], dir_: str, prefix: str="", ndigits: int=6):
         items = ((str(i).rjust(ndigits, '0'), obj) for i, obj in enumerate(iterable))
@@ -618,9 +937,9 @@ class FlexiblePersist:
             ext = '.' + ext.lstrip('.')
 
         load = partial(self.load, auto_extension=False)
-        pat = re.compile(re.escape(prefix) + r"(?P<k>{})".format(pattern) + re.escape(ext))
-        ms = filter(None, map(pat.fullmatch, os.listdir(dir_)))
-        fs = ((m.group('k'), os.path.join(dir_, m.group())) for m in ms)
+        with os.scandir(dir_) as entries:
+            names = [entry.name for entry in entries]
+        fs = ((k, os.path.join(dir_, name)) for k, name in _dir_keys(names, prefix, pattern, ext))
 
         if key_type is not None:
             fs = ((key_type(k), v) for k, v in fs)
@@ -646,33 +965,34 @@ class FlexiblePersist:
 class _TextIOMethods:
     def __init__(self, flexible_persist: FlexiblePersist):
         self._io = flexible_persist
+        # fixed at construction; bound here so the per-line loops don't pay for attribute lookups
+        self._encode = flexible_persist.to_line
+        self._decode = flexible_persist.from_line
 
     def dump_stream_to_file(self, iterable: Iterable[object], file: Union[str, io.IOBase], auto_extension=True):
-        encode = self._io.to_line
-        lines = map(encode, iterable)
+        encode = self._encode
+        lines = (encode(obj) + '\n' for obj in iterable)
         close = False
 
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self._io.text_extension)
-            file = open(file, "w")
+            file = open(file, "w", buffering=self._io._io_buffer_size)
             close = True
 
-        for line in lines:
-            file.write(line)
-            file.write('\n')
+        file.writelines(lines)
 
         if close:
             file.close()
 
     def load_stream_from_file(self, file: Union[str, io.IOBase], auto_extension=True) -> Iterator[object]:
-        decode = self._io.from_line
+        decode = self._decode
         close = False
 
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self._io.text_extension)
-            file = open(file, "r")
+            file = open(file, "r", buffering=self._io._io_buffer_size)
             close = True
 
         for line in file:
@@ -683,36 +1003,35 @@ class _TextIOMethods:
 
     def dump_keyed_stream_to_file(self, iterable: Iterable[Tuple[str, object]], file: Union[str, io.IOBase],
                                   encode_keys=False, sep='\t', auto_extension=True):
-        encode = self._io.to_line
-        template = '{}' + sep + '{}\n'
+        encode = self._encode
+        template = ('{}' + sep + '{}\n').format
 
         if encode_keys:
-            lines = (template.format(encode(k), encode(v)) for k, v in iterable)
+            lines = (template(encode(k), encode(v)) for k, v in iterable)
         else:
-            lines = (template.format(k, encode(v)) for k, v in iterable)
+            lines = (template(k, encode(v)) for k, v in iterable)
         close = False
 
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self._io.text_extension)
-            file = open(file, "w")
+            file = open(file, "w", buffering=self._io._io_buffer_size)
             close = True
 
-        for line in lines:
-            file.write(line)
+        file.writelines(lines)
 
         if close:
             file.close()
 
     def load_keyed_stream_from_file(self, file: Union[str, io.IOBase],
                                     decode_keys=False, sep='\t', auto_extension=True) -> Iterator[object]:
-        decode = self._io.from_line
+        decode = self._decode
         close = False
 
         if isinstance(file, PATH_TYPES):
             if auto_extension:
                 file = _maybe_add_extension(file, self._io.text_extension)
-            file = open(file, "r")
+            file = open(file, "r", buffering=self._io._io_buffer_size)
             close = True
 
         def read_items(f, sep_):
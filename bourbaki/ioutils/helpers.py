@@ -1,10 +1,84 @@
 #coding:utf-8
 import os
-from .pickleutils import pickle_load, pickle_dump
+import pickle
+import threading
+from logging import getLogger
+from .pickleutils import pickle_load, pickle_dump, SIDECAR_SUFFIX
 
+logger = getLogger(__name__)
 
-def maybe_load(path, f, args=(), kwargs=None, loader=pickle_load, dumper=pickle_dump, recompute=False, dump=True):
-    """Helpful e.g. in a Jupyter notebook setting """
+# absolute path -> (mtime in ns, object) for maybe_load(..., memoize=True)
+_LOAD_CACHE = {}
+
+
+def _load(path, loader, memoize, stat=None):
+    """raises FileNotFoundError when path doesn't exist, so that no separate existence check is needed. stat may be
+    passed if the caller already has it, to avoid a second os.stat"""
+    if not memoize:
+        return loader(path)
+
+    key = os.path.abspath(path)
+    mtime = (os.stat(path) if stat is None else stat).st_mtime_ns
+    cached = _LOAD_CACHE.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    obj = loader(path)
+    _LOAD_CACHE[key] = (mtime, obj)
+    return obj
+
+
+def _tmp_path(path):
+    """A hidden temporary path in the same directory as path, unique to the calling process and thread, and with the
+    same extension, since some dumpers (e.g. numpy.save) choose a format by, or append, the extension"""
+    dirname, basename = os.path.split(os.fspath(path))
+    stem, ext = os.path.splitext(basename)
+    return os.path.join(dirname, ".{}.{}.{}.tmp{}".format(stem, os.getpid(), threading.get_ident(), ext))
+
+
+# suffixes of companion files that a dumper may write alongside its main output, which are moved into place with it
+COMPANION_SUFFIXES = (SIDECAR_SUFFIX,)
+
+
+def _replace_outputs(tmp_path, path):
+    # fail before moving anything if the dumper didn't write the main file
+    os.stat(tmp_path)
+    # companion files first, so that the main file never appears before the files it depends on
+    for suffix in COMPANION_SUFFIXES:
+        try:
+            os.replace(tmp_path + suffix, path + suffix)
+        except FileNotFoundError:
+            pass
+    os.replace(tmp_path, path)
+
+
+def _remove_outputs(tmp_path):
+    for tmp in (tmp_path, *(tmp_path + suffix for suffix in COMPANION_SUFFIXES)):
+        try:
+            os.remove(tmp)
+        except FileNotFoundError:
+            pass
+
+
+def _timestamp(path_or_timestamp):
+    if isinstance(path_or_timestamp, (int, float)):
+        return path_or_timestamp
+    try:
+        return os.stat(path_or_timestamp).st_mtime
+    except FileNotFoundError:
+        raise ValueError("reference path for newer_than does not exist: {}".format(path_or_timestamp))
+
+
+def maybe_load(path, f, args=(), kwargs=None, loader=pickle_load, dumper=pickle_dump, recompute=False, dump=True,
+               memoize=False, newer_than=None):
+    """Helpful e.g. in a Jupyter notebook setting. When memoize is True, objects loaded or dumped here are kept in
+    memory and returned directly by later calls as long as the file at path is unmodified; note that the same object
+    is then returned each time, so mutations to it will be visible to later callers.
+    For large objects backed by buffers, e.g. numpy arrays, pass loader=pickle_load_with_sidecar and
+    dumper=pickle_dump_with_sidecar; the buffers are then memory-mapped on load rather than copied.
+    newer_than may be a path or a timestamp in seconds since the epoch; if the file at path was last modified before
+    it (e.g. the source data it was computed from has since changed), the object is recomputed. A ValueError is
+    raised if newer_than is a path that doesn't exist."""
     def _compute(f, args, kwargs, dump, dumper):
         if kwargs is None:
             obj = f(*args)
@@ -12,28 +86,51 @@ def maybe_load(path, f, args=(), kwargs=None, loader=pickle_load, dumper=pickle_
             obj = f(*args, **kwargs)
 
         if dump:
+            # dump to a temporary file and move it into place, so that a failed or partial write never leaves a
+            # corrupt file at path, and concurrent readers see either the old file or the complete new one
+            tmp_path = _tmp_path(path)
             try:
-                print("attempting to save to {} using {}".format(path, dumper))
-                dumper(obj, path)
-            except Exception as e:
-                print("!!! saving to {} failed with exception '{}'; recomputing".format(path, e))
-                os.remove(path)
+                logger.info("attempting to save to %s using %s", path, dumper)
+                dumper(obj, tmp_path)
+                _replace_outputs(tmp_path, os.fspath(path))
+            except (OSError, pickle.PickleError, TypeError, AttributeError, RecursionError) as e:
+                # errors from a failed write or an unpicklable or too deeply nested object; the computed obj is
+                # still returned
+                logger.warning("saving to %s failed with exception '%s'", path, e)
+                _remove_outputs(tmp_path)
+            except BaseException:
+                _remove_outputs(tmp_path)
+                raise
             else:
-                print("--> saved to {} successfully".format(path))
+                logger.info("saved to %s successfully", path)
+                if memoize:
+                    _LOAD_CACHE[os.path.abspath(path)] = (os.stat(path).st_mtime_ns, obj)
         return obj
 
-    if (not recompute) and os.path.exists(path):
+    stat = None
+    if not recompute and newer_than is not None:
         try:
-            print("attempting to load from {} using {}".format(path, loader))
-            obj = loader(path)
+            stat = os.stat(path)
+        except FileNotFoundError:
+            pass
+        else:
+            if stat.st_mtime < _timestamp(newer_than):
+                logger.info("%s is older than %s; recomputing", path, newer_than)
+                recompute = True
+
+    if not recompute:
+        try:
+            logger.info("attempting to load from %s using %s", path, loader)
+            obj = _load(path, loader, memoize, stat)
+        except FileNotFoundError:
+            logger.info("%s not found; computing", path)
+            obj = _compute(f, args, kwargs, dump, dumper)
         except Exception as e:
-            print("!!! loading from {} failed with exception '{}'; recomputing".format(path, e))
+            logger.warning("loading from %s failed with exception '%s'; recomputing", path, e)
             obj = _compute(f, args, kwargs, dump, dumper)
         else:
-            print("--> loaded from {} successfully".format(path))
+            logger.info("loaded from %s successfully", path)
     else:
-        if not recompute:
-            print("{} not found; computing".format(path))
         obj = _compute(f, args, kwargs, dump, dumper)
 
     return obj
@@ -1,18 +1,36 @@
 # coding:utf-8
-from typing import Union
+from typing import Union, Callable, Iterable, Optional as Opt
 import io
+import os
+import errno
+import mmap
 import pickle
+import struct
 import platform
+import threading
 from pathlib import Path
-from multipledispatch import Dispatcher
-from logging import getLogger
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from logging import getLogger, DEBUG
 from bourbaki.introspection.typechecking import type_checker
+from .compression import FILE_COMPRESSORS, FILE_DECOMPRESSORS
 
 logger = getLogger(__name__)
 
 SYSTEM_ALIAS = platform.system()
 OS_IS_DARWIN = SYSTEM_ALIAS == 'Darwin'
 DEFAULT_PROTOCOL = pickle.HIGHEST_PROTOCOL
+# largest read/write size that is safe on Darwin
+MAX_IO_CHUNK = (1 << 31) - 1
+# buffer size used when pickling to or from a raw, unbuffered file
+IO_BUFFER_SIZE = 1 << 20
+# out-of-band buffers of a pickle written with pickle_dump_with_sidecar go in a file with this suffix
+SIDECAR_SUFFIX = '.buffers'
+# max threads used by PartiallyPicklable.from_pickles to load attributes stored at separate paths
+PICKLES_IO_THREADS = 8
+# max pickled attributes waiting to be written by PartiallyPicklable.to_pickles
+PICKLES_QUEUE_SIZE = 2
 
 _pickle_load = pickle.load
 _pickle_dump = pickle.dump
@@ -26,73 +44,262 @@ class MacOSFile(io.IOBase):
     def __getattr__(self, item):
         return getattr(self.f, item)
 
-    def read(self, n):
-        if n >= (1 << 31):
-            buffer = bytearray(n)
-            idx = 0
-            while idx < n:
-                batch_size = min(n - idx, 1 << 31 - 1)
-                buffer[idx:idx + batch_size] = self.f.read(batch_size)
-                idx += batch_size
-            return buffer
-        return self.f.read(n)
+    def read(self, n=-1):
+        if n is None or n < 0:
+            # read to EOF, but still in chunks of at most MAX_IO_CHUNK
+            chunks = []
+            while True:
+                chunk = self.f.read(MAX_IO_CHUNK)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+        if n <= MAX_IO_CHUNK:
+            return self.f.read(n)
+
+        # read in place into a single preallocated buffer; it's returned as-is, since converting to bytes would
+        # copy the whole thing again
+        buffer = bytearray(n)
+        view = memoryview(buffer)
+        readinto = getattr(self.f, 'readinto', None)
+        idx = 0
+        while idx < n:
+            end = min(n, idx + MAX_IO_CHUNK)
+            if readinto is not None:
+                k = readinto(view[idx:end])
+            else:
+                chunk = self.f.read(end - idx)
+                k = len(chunk)
+                view[idx:idx + k] = chunk
+            if not k:
+                break
+            idx += k
+        view.release()
+        if idx < n:
+            del buffer[idx:]
+        return buffer
+
+    def readinto(self, buffer):
+        view = memoryview(buffer).cast('B')
+        n = view.nbytes
+        if n <= MAX_IO_CHUNK:
+            return self.f.readinto(view)
+
+        idx = 0
+        while idx < n:
+            k = self.f.readinto(view[idx:idx + MAX_IO_CHUNK])
+            if not k:
+                break
+            idx += k
+        return idx
+
+    def readinto1(self, buffer):
+        # a short read is allowed here, so one capped call suffices
+        return self.f.readinto1(memoryview(buffer).cast('B')[:MAX_IO_CHUNK])
+
+    def read1(self, n=-1):
+        return self.f.read1(MAX_IO_CHUNK if n < 0 or n > MAX_IO_CHUNK else n)
+
+    def readline(self, size=-1):
+        # io.IOBase.readline would otherwise assemble the line from many small peek()/read() calls
+        return self.f.readline(size)
+
+    # io.IOBase defines these, so __getattr__ never reaches them; delegate explicitly so that the wrapper reports
+    # the capabilities and position of the underlying file. close() is deliberately not delegated: the wrapper is
+    # often discarded while the caller keeps using the underlying file
+    def readable(self):
+        return self.f.readable()
+
+    def writable(self):
+        return self.f.writable()
+
+    def seekable(self):
+        return self.f.seekable()
+
+    def seek(self, *args):
+        return self.f.seek(*args)
+
+    def tell(self):
+        return self.f.tell()
+
+    def fileno(self):
+        return self.f.fileno()
 
     def write(self, buffer):
-        n = len(buffer)
+        # slices of a memoryview don't copy
+        view = memoryview(buffer).cast('B')
+        n = view.nbytes
         idx = 0
         while idx < n:
-            batch_size = min(n - idx, 1 << 31 - 1)
-            self.f.write(buffer[idx:idx + batch_size])
-            idx += batch_size
+            chunk = view[idx:idx + MAX_IO_CHUNK]
+            k = self.f.write(chunk)
+            # raw files may write only part of the chunk, and None means the write would block (a non-blocking raw
+            # file); report what was written rather than silently dropping the rest
+            if not k:
+                raise BlockingIOError(errno.EAGAIN, "write could not complete without blocking", idx)
+            idx += k
+        return n
+
+
+def pickle_dump(obj, file: Union[str, Path, io.IOBase], protocol=DEFAULT_PROTOCOL,
+                buffer_callback: Opt[Callable]=None, compression: Opt[str]=None):
+    """pickle.dump, accepting a path as well as a file handle, and safe for large objects on Darwin. compression may
+    name any streaming compressor registered with flexiblepersist's IORegistry (e.g. 'gzip', or 'zstd' when
+    zstandard is installed), in which case the pickle stream is compressed on its way to the file"""
+    if isinstance(file, str):
+        pickle_dump_str(obj, file, protocol=protocol, buffer_callback=buffer_callback, compression=compression)
+    elif isinstance(file, Path):
+        pickle_dump_path(obj, file, protocol=protocol, buffer_callback=buffer_callback, compression=compression)
+    else:
+        # any file-like, including those not deriving from io.IOBase, e.g. streaming compressors
+        pickle_dump_file(obj, file, protocol=protocol, buffer_callback=buffer_callback, compression=compression)
+
 
+def pickle_dump_str(obj, file: str, protocol=DEFAULT_PROTOCOL, buffer_callback: Opt[Callable]=None,
+                    compression: Opt[str]=None):
+    # the file itself is the context manager, so that it's closed on exit even when wrapped on Darwin
+    with open(file, 'wb') as f:
+        pickle_dump_file(obj, f, protocol=protocol, buffer_callback=buffer_callback, compression=compression)
 
-pickle_dump = Dispatcher("pickle_dump")
 
+def pickle_dump_path(obj, file: Path, protocol=DEFAULT_PROTOCOL, buffer_callback: Opt[Callable]=None,
+                     compression: Opt[str]=None):
+    with file.open('wb') as f:
+        pickle_dump_file(obj, f, protocol=protocol, buffer_callback=buffer_callback, compression=compression)
 
-@pickle_dump.register(object, str)
-def pickle_dump_str(obj, file, protocol=DEFAULT_PROTOCOL):
-    with os_safe_file(open(file, 'wb')) as f:
-        pickle_dump(obj, f, protocol=protocol)
 
+def pickle_dump_file(obj, file: Union[io.FileIO, io.IOBase], protocol=DEFAULT_PROTOCOL,
+                     buffer_callback: Opt[Callable]=None, compression: Opt[str]=None):
+    if compression is not None:
+        # the compressor batches writes to the file itself, so no extra buffering is needed
+        with _compressed(os_safe_file(file), compression, reading=False) as f:
+            _pickle_dump(obj, f, protocol=protocol, **_oob_kw('buffer_callback', buffer_callback))
+        return
 
-@pickle_dump.register(object, Path)
-def pickle_dump_path(obj, file: Path, protocol=DEFAULT_PROTOCOL):
-    pickle_dump(obj, str(file), protocol=protocol)
+    with _buffered(file, reading=False) as f:
+        _pickle_dump(obj, os_safe_file(f), protocol=protocol, **_oob_kw('buffer_callback', buffer_callback))
 
 
-@pickle_dump.register(object, (io.FileIO, io.IOBase))
-def pickle_dump_file(obj, file: Union[io.FileIO, io.IOBase], protocol=DEFAULT_PROTOCOL):
-    _pickle_dump(obj, os_safe_file(file), protocol=protocol)
+def _oob_kw(name, value):
+    # pickle.dump/load only accept buffer_callback/buffers from python 3.8; pass them only when they're used
+    return {} if value is None else {name: value}
 
 
-pickle_load = Dispatcher("pickle_load")
+def pickle_load(file: Union[str, Path, io.IOBase], buffers: Opt[Iterable]=None, compression: Opt[str]=None):
+    """pickle.load, accepting a path as well as a file handle, and safe for large objects on Darwin. compression
+    should match that passed to pickle_dump. Note that decompressors read ahead, so a compressed pickle should be the
+    last thing read from a file handle"""
+    if isinstance(file, str):
+        return pickle_load_str(file, buffers=buffers, compression=compression)
+    elif isinstance(file, Path):
+        return pickle_load_path(file, buffers=buffers, compression=compression)
+    return pickle_load_file(file, buffers=buffers, compression=compression)
 
 
-@pickle_load.register(str)
-def pickle_load_str(path: str):
+def pickle_load_str(path: str, buffers: Opt[Iterable]=None, compression: Opt[str]=None):
     with open(path, 'rb') as f:
-        obj = pickle_load(f)
+        obj = pickle_load_file(f, buffers=buffers, compression=compression)
     return obj
 
 
-@pickle_load.register(Path)
-def pickle_load_path(path: Path):
-    return pickle_load(str(path))
+def pickle_load_path(path: Path, buffers: Opt[Iterable]=None, compression: Opt[str]=None):
+    with path.open('rb') as f:
+        return pickle_load_file(f, buffers=buffers, compression=compression)
+
 
+def pickle_load_file(file: Union[io.FileIO, io.IOBase], buffers: Opt[Iterable]=None, compression: Opt[str]=None):
+    if compression is not None:
+        with _compressed(os_safe_file(file), compression, reading=True) as f:
+            return _pickle_load(f, **_oob_kw('buffers', buffers))
 
-@pickle_load.register((io.FileIO, io.IOBase))
-def pickle_load_file(file: Union[io.FileIO, io.IOBase]):
-    return _pickle_load(os_safe_file(file))
+    with _buffered(file, reading=True) as f:
+        return _pickle_load(os_safe_file(f), **_oob_kw('buffers', buffers))
 
 
-def os_safe_file(file: Union[io.IOBase, io.FileIO]):
-    if OS_IS_DARWIN and not isinstance(file, MacOSFile):
-        file = MacOSFile(file)
-    return file
+def _compressed(file, compression: str, reading: bool):
+    """Wrap file for streaming (de)compression, using the file (de)compressors that FlexiblePersist uses"""
+    if compression not in FILE_COMPRESSORS or compression not in FILE_DECOMPRESSORS:
+        # only those that can be both written and read back
+        available = tuple(c for c in FILE_COMPRESSORS if c in FILE_DECOMPRESSORS)
+        raise ValueError("unknown compression {!r}; choose from {}".format(compression, available))
+    return (FILE_DECOMPRESSORS if reading else FILE_COMPRESSORS)[compression](file)
+
+
+@contextmanager
+def _buffered(file, reading: bool):
+    """Pickle issues many small reads and writes, each a syscall on a raw file; buffer them. On exit the buffer is
+    detached, leaving the raw file positioned just past the pickle, as though it had been used directly."""
+    if not isinstance(file, io.RawIOBase) or (reading and not file.seekable()):
+        # read-ahead can't be given back to an unseekable file
+        yield file
+        return
+
+    if reading:
+        buffered = io.BufferedReader(file, IO_BUFFER_SIZE)
+        try:
+            yield buffered
+        finally:
+            pos = buffered.tell()
+            buffered.detach()
+            file.seek(pos)
+    else:
+        buffered = io.BufferedWriter(file, IO_BUFFER_SIZE)
+        try:
+            yield buffered
+        finally:
+            # flushes
+            buffered.detach()
+
+
+if OS_IS_DARWIN:
+    def os_safe_file(file: Union[io.IOBase, io.FileIO]):
+        return file if isinstance(file, MacOSFile) else MacOSFile(file)
+else:
+    def os_safe_file(file: Union[io.IOBase, io.FileIO]):
+        # the 2GiB read/write limit is specific to Darwin; use files as-is elsewhere
+        return file
+
+
+def pickle_dump_with_sidecar(obj, path: Union[str, Path], protocol: int=5):
+    """Pickle obj to path, writing any out-of-band buffers (e.g. the data underlying numpy arrays) directly to a
+    sidecar file at path + SIDECAR_SUFFIX rather than copying them into the pickle stream. The sidecar holds the raw
+    buffers back-to-back, followed by their lengths and then their count, as little-endian uint64's."""
+    lengths = []
+    with open(os.fspath(path) + SIDECAR_SUFFIX, 'wb') as f:
+        # the file itself is the context manager, since the Darwin wrapper doesn't close it
+        sidecar = os_safe_file(f)
+
+        def buffer_callback(buf: pickle.PickleBuffer):
+            try:
+                raw = buf.raw()
+            except BufferError:
+                # not contiguous; serialize in-band
+                return True
+            sidecar.write(raw)
+            lengths.append(raw.nbytes)
 
+        pickle_dump(obj, path, protocol=protocol, buffer_callback=buffer_callback)
+        sidecar.write(struct.pack('<{}Q'.format(len(lengths) + 1), *lengths, len(lengths)))
 
-pickle.dump = pickle_dump
-pickle.load = pickle_load
+
+def pickle_load_with_sidecar(path: Union[str, Path]):
+    """Load a pickle written by pickle_dump_with_sidecar. The sidecar file is memory-mapped copy-on-write and the
+    out-of-band buffers are passed to the unpickler as views of it, so large buffers are paged in lazily rather than
+    copied, and the loaded objects remain writable without modifying the file."""
+    with open(os.fspath(path) + SIDECAR_SUFFIX, 'rb') as sidecar:
+        size = os.fstat(sidecar.fileno()).st_size
+        mapped = memoryview(mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_COPY))
+
+    n, = struct.unpack_from('<Q', mapped, size - 8)
+    lengths = struct.unpack_from('<{}Q'.format(n), mapped, size - 8 * (n + 1))
+    buffers = []
+    offset = 0
+    for length in lengths:
+        buffers.append(mapped[offset:offset + length])
+        offset += length
+
+    return pickle_load(path, buffers=buffers)
 
 
 class Picklable:
@@ -129,87 +336,115 @@ class PartiallyPicklable(Picklable):
     _unpicklable_attrs = ()
     _minimal_state_attrs = None
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._init_attr_specs()
+
+    @classmethod
+    def _init_attr_specs(cls):
+        """The default implementations of the classmethods below depend only on class attributes; compute what they
+        need once per class. They return fresh lists, so callers may mutate the results"""
+        cls._unpicklable_types_tuple = tuple(n if isinstance(n, tuple) else (n, None) for n in cls._unpicklable_attrs)
+        cls._unpicklable_attrs_tuple = tuple(n for n, _ in cls._unpicklable_types_tuple)
+        if cls._minimal_state_attrs is not None:
+            cls._minimal_state_attrs_tuple = tuple(cls._minimal_state_attrs)
+            cls._minimal_state_attrs_set = frozenset(cls._minimal_state_attrs)
+
     @classmethod
     def unpicklable_types(cls):
-        return list(n if isinstance(n, tuple) else (n, None) for n in cls._unpicklable_attrs)
+        return list(cls._unpicklable_types_tuple)
 
     @classmethod
     def unpicklable_attrs(cls):
-        return list(n if not isinstance(n, tuple) else n[0] for n in cls._unpicklable_attrs)
+        return list(cls._unpicklable_attrs_tuple)
 
     @classmethod
     def minimial_state_attrs(cls):
-        return cls.unpicklable_attrs() if cls._minimal_state_attrs is None else list(cls._minimal_state_attrs)
+        return cls.unpicklable_attrs() if cls._minimal_state_attrs is None else list(cls._minimal_state_attrs_tuple)
 
     @classmethod
     def minimal_state_types(cls):
         if cls._minimal_state_attrs is None:
             return cls.unpicklable_types()
-        attrs = set(cls._minimal_state_attrs)
+        attrs = cls._minimal_state_attrs_set
         return [tup for tup in cls.unpicklable_types() if tup[0] in attrs]
 
     def __getstate__(self):
-        state = self.__dict__.copy()
-
+        # build the state without the skipped attributes rather than copying everything and then popping them
         attrs = self.unpicklable_attrs()
-        dont_pickle = tuple(a for a in attrs if a in state)
-        logger.debug("not pickling attributes {}; these may be large or unpicklable and should be "
-                     "persisted separately, e.g. with the .to_pickles() method on this instance".format(dont_pickle))
-        for attr in dont_pickle:
-            state.pop(attr)
+        skip = frozenset(attrs)
+        state = {k: v for k, v in self.__dict__.items() if k not in skip}
+
+        if logger.isEnabledFor(DEBUG):
+            dont_pickle = tuple(a for a in attrs if a in self.__dict__)
+            logger.debug("not pickling attributes %s; these may be large or unpicklable and should be persisted "
+                         "separately, e.g. with the .to_pickles() method on this instance", dont_pickle)
 
         return state
 
     @classmethod
-    def from_pickles(cls, path_file_or_instance: Union[str, io.IOBase, object],
+    def from_pickles(cls, path_file_or_instance: Union[str, io.IOBase, object], *, _compression: Opt[str]=None,
                      **attr_files: Union[str, io.IOBase, object]):
         """Each argument may be a path name, file handle, or object of a specified type.
         If not a path or file handle, the first arg must be an instance of the class on which the method is being
         called. Allowable keyword args are specified in the class' _unpicklable_attrs tuple. Any entry there of
         may be a name string or (name, type) tuple. In the latter case, if the corresponding keyword argument passed to
-        from_pickles() is not a file handle or str, it must be an instance of the specified type."""
-
-        all_attrs = cls.minimial_state_attrs()
-        extras = set(attr_files).difference(all_attrs)
-        missing = set(all_attrs).difference(attr_files)
-
-        if extras:
-            logger.warning("{} has unpicklable attributes {} but keyword args {} were passed"
-                           .format(cls, all_attrs, extras))
-        if missing:
-            logger.warning("{} has unpicklable_attrs {} but keyword args {} were not passed"
-                           .format(cls, all_attrs, missing))
+        from_pickles() is not a file handle or str, it must be an instance of the specified type.
+        _compression should match that passed to .to_pickles(); it applies to the attribute files only. It's
+        underscored so as not to collide with the name of an attribute."""
+
+        all_attrs = frozenset(cls.minimial_state_attrs())
+        if attr_files.keys() != all_attrs:
+            extras = attr_files.keys() - all_attrs
+            missing = all_attrs - attr_files.keys()
+            if extras:
+                logger.warning("%s has unpicklable attributes %s but keyword args %s were passed",
+                               cls, cls.minimial_state_attrs(), extras)
+            if missing:
+                logger.warning("%s has unpicklable_attrs %s but keyword args %s were not passed",
+                               cls, cls.minimial_state_attrs(), missing)
 
         self = cls.from_pickle(path_file_or_instance) \
             if not isinstance(path_file_or_instance, cls) \
             else path_file_or_instance
 
-        for attr, type_ in cls.minimal_state_types():
-            if attr in attr_files:
-                path = attr_files[attr]
-                obj = _maybe_from_pickle(path, type_, attr)
-                setattr(self, attr, obj)
-
-        return self
+        specs = [(attr, type_, attr_files[attr]) for attr, type_ in cls.minimal_state_types() if attr in attr_files]
+        # attributes stored at separate paths are loaded concurrently; the attributes are still set in the order
+        # specified by the class. File handles are loaded in order, since they may refer to the same file
+        paths = [spec for spec in specs if isinstance(spec[2], str)]
+        loaded = {}
+        if len(paths) > 1:
+            with ThreadPoolExecutor(min(PICKLES_IO_THREADS, len(paths))) as executor:
+                loaded = {attr: executor.submit(_maybe_from_pickle, path, type_, attr, _compression)
+                          for attr, type_, path in paths}
 
-    def to_pickles(self, path_or_file: Union[str, io.IOBase], **attr_files):
-        attrs_to_pickle = set(attr_files)
-        all_attrs = set(self.minimial_state_attrs())
+        for attr, type_, path in specs:
+            obj = loaded[attr].result() if attr in loaded else _maybe_from_pickle(path, type_, attr, _compression)
+            setattr(self, attr, obj)
 
-        extras = attrs_to_pickle.difference(all_attrs)
-        missing = all_attrs.difference(attrs_to_pickle)
+        return self
 
-        if extras:
-            no_attrs = [attr for attr in extras if not hasattr(self, attr)]
-            if no_attrs:
-                raise KeyError("{} does not have attributes {}, so they cannot be pickled"
-                               .format(self, tuple(no_attrs)))
-            else:
-                logger.warning("{} has unpicklable attributes {} but keyword args {} were passed"
-                               .format(type(self), all_attrs, extras))
-        if missing:
-            logger.warning("{} has unpicklable_attrs {} but keyword args {} were not passed"
-                           .format(type(self), all_attrs, missing))
+    def to_pickles(self, path_or_file: Union[str, io.IOBase], *, _compression: Opt[str]=None, **attr_files):
+        """Pickle this instance to path_or_file, and the attributes in its _unpicklable_attrs to the paths or file
+        handles passed as keyword args. _compression may name a streaming compressor as for pickle_dump, e.g.
+        'zstd', to compress the attribute files, which is worthwhile for large attributes on slow or networked
+        storage; it's underscored so as not to collide with the name of an attribute. Compressed attributes sharing
+        a file handle can't be loaded again, since decompressors read ahead."""
+        all_attrs = frozenset(self.minimial_state_attrs())
+        if attr_files.keys() != all_attrs:
+            extras = attr_files.keys() - all_attrs
+            missing = all_attrs - attr_files.keys()
+            if extras:
+                no_attrs = [attr for attr in extras if not hasattr(self, attr)]
+                if no_attrs:
+                    raise KeyError("{} does not have attributes {}, so they cannot be pickled"
+                                   .format(self, tuple(no_attrs)))
+                else:
+                    logger.warning("%s has unpicklable attributes %s but keyword args %s were passed",
+                                   type(self), self.minimial_state_attrs(), extras)
+            if missing:
+                logger.warning("%s has unpicklable_attrs %s but keyword args %s were not passed",
+                               type(self), self.minimial_state_attrs(), missing)
 
         badfiles = list(zip(*((k, v) for k, v in attr_files.items() if not isinstance(v, (str, io.IOBase)))))
         if badfiles:
@@ -218,21 +453,78 @@ class PartiallyPicklable(Picklable):
                             .format(tuple(badfiles), tuple(badattrs)))
 
         self.to_pickle(path_or_file)
-        for attr, file in attr_files.items():
-            pickle_dump(getattr(self, attr), file)
+        if len(attr_files) < 2:
+            for attr, file in attr_files.items():
+                pickle_dump(getattr(self, attr), file, compression=_compression)
+            return
+
+        # pickling is CPU-bound and writing is I/O-bound; overlap the two by pickling each attribute in memory here
+        # while a writer thread writes the previous ones out, in order. The bounded queue limits the number of
+        # pickled attributes held in memory at once
+        payloads = Queue(PICKLES_QUEUE_SIZE)
+        errors = []
+
+        def write_payloads():
+            while True:
+                item = payloads.get()
+                if item is None:
+                    return
+                if not errors:
+                    try:
+                        _write_payload(*item, compression=_compression)
+                    except BaseException as e:
+                        errors.append(e)
+
+        writer = threading.Thread(target=write_payloads, daemon=True)
+        writer.start()
+        try:
+            for attr, file in attr_files.items():
+                if errors:
+                    break
+                payloads.put((file, pickle.dumps(getattr(self, attr), protocol=DEFAULT_PROTOCOL)))
+        finally:
+            payloads.put(None)
+            writer.join()
+        if errors:
+            raise errors[0]
+
+
+def _write_payload(file: Union[str, io.IOBase], payload: bytes, compression: Opt[str]=None):
+    if isinstance(file, str):
+        with open(file, 'wb') as f:
+            _write_payload(f, payload, compression)
+    elif compression is not None:
+        with _compressed(os_safe_file(file), compression, reading=False) as f:
+            f.write(payload)
+    else:
+        os_safe_file(file).write(payload)
+
+
+PartiallyPicklable._init_attr_specs()
 
 
-def _maybe_from_pickle(path_or_file, cls, attr=None):
+# type -> checker function from type_checker, which is costly to construct
+_type_checkers = {}
+
+
+def _get_type_checker(cls):
+    checker = _type_checkers.get(cls)
+    if checker is None:
+        checker = _type_checkers[cls] = type_checker(cls)
+    return checker
+
+
+def _maybe_from_pickle(path_or_file, cls, attr=None, compression: Opt[str]=None):
     if isinstance(path_or_file, (str, io.IOBase)):
-        obj = pickle_load(path_or_file)
+        obj = pickle_load(path_or_file, compression=compression)
 
-        if cls is not None and not type_checker(cls)(obj):
+        if cls is not None and not _get_type_checker(cls)(obj):
             raise TypeError("Expected unpickled object{} to be an instance of {}; got {}"
                             .format("for attribute {}".format(attr) if attr is not None else "",
                                     cls, type(obj))
                             )
     else:
-        if cls is not None and not type_checker(cls)(path_or_file):
+        if cls is not None and not _get_type_checker(cls)(path_or_file):
             raise TypeError("Expected str, io.IOBase, or {} for path_or_file; "
                             "got {}".format(cls, type(path_or_file)))
         obj = path_or_file
@@ -1,6 +1,7 @@
 #coding:utf-8
+import os
 import pytest
-from bourbaki.ioutils.flexiblepersist import FlexiblePersist, DefaultIORegistry, NoTextIOMethodsAvailable
+from bourbaki.ioutils.flexiblepersist import FlexiblePersist, IORegistry, DefaultIORegistry, NoTextIOMethodsAvailable
 
 
 @pytest.fixture
@@ -58,3 +59,160 @@ def assert_io_equal(data, path, i, o, owrapper=None, iwrapper=None, compare_orig
         assert i(path) == source
     else:
         assert iwrapper(i(path)) == source
+
+
+@pytest.mark.parametrize('serialization', ['pickle', 'json'])
+@pytest.mark.parametrize('compression', list(DefaultIORegistry.compressors.keys()))
+def test_streamed_compression_matches_buffered(data, serialization, compression, tmpdir):
+    io_ = FlexiblePersist(serialization, compression=compression)
+    path = str(tmpdir.join('data' + io_.extension))
+
+    io_.dump(data, path)
+    with open(path, 'rb') as f:
+        assert io_.loads(f.read()) == data
+
+    with open(path, 'wb') as f:
+        f.write(io_.dumps(data))
+    assert io_.load(path) == data
+
+
+@pytest.mark.parametrize('serialization', ['pickle', 'json'])
+def test_parallel_gzip(data, serialization, tmpdir, monkeypatch):
+    pytest.importorskip('rapidgzip')
+    from bourbaki.ioutils import compression
+    monkeypatch.setattr(compression, 'PARALLEL_GZIP_MIN_SIZE', 0)
+    monkeypatch.setattr(compression, 'CPU_COUNT', 2)
+
+    io_ = FlexiblePersist(serialization, compression='gzip')
+    assert io_.loads(io_.dumps(data)) == data
+
+    path = str(tmpdir.join('data' + io_.extension))
+    io_.dump(data, path)
+    assert io_.load(path) == data
+
+
+def test_pipeline_from_extension_sees_new_registrations():
+    registry = IORegistry()
+    assert registry.pipeline_from_extension('.pkl.gzip') == ('pickle', 'gzip', None)
+    with pytest.raises(ValueError):
+        registry.compression_from_extension('.ident')
+
+    registry.register_compressor('identity', compressor=bytes, decompressor=bytes, extension='ident')
+    assert registry.pipeline_from_extension('.pkl.ident') == ('pickle', 'identity', None)
+
+
+def test_get_serializer_and_deserializer(data):
+    registry = IORegistry()
+    dumps = registry.get_serializer('pickle', string=True)
+    loads = registry.get_deserializer('pickle', string=True)
+    assert loads(dumps(data)) == data
+    assert registry.get_deserializer('msgpack') is registry.file_loaders['msgpack']
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_pickle5_out_of_band_buffers(compression, tmpdir):
+    if 'pickle5' not in DefaultIORegistry.dumpers:
+        pytest.skip("pickle protocol 5 is unavailable")
+    data = dict(buf=bytearray(b'abc' * 1000), nested=[bytearray(10), b'xyz'])
+    io_ = FlexiblePersist('pickle5', compression=compression)
+    assert io_.loads(io_.dumps(data)) == data
+
+    path = str(tmpdir.join('data'))
+    io_.dump(data, path)
+    loaded = io_.load(path)
+    assert loaded == data
+    assert isinstance(loaded['buf'], bytearray)
+
+
+@pytest.mark.parametrize('kind', ['string', 'stream'])
+def test_register_serializer(data, kind, tmpdir):
+    import marshal
+    registry = IORegistry()
+    if kind == 'string':
+        registry.register_serializer('marshal', extension='marshal',
+                                     serializer=marshal.dumps, deserializer=marshal.loads)
+    else:
+        registry.register_serializer('marshal', extension='marshal',
+                                     stream_serializer=marshal.dump, stream_deserializer=marshal.load)
+
+    io_ = FlexiblePersist('marshal', compression='gzip', _io_registry=registry)
+    assert io_.loads(io_.dumps(data)) == data
+    path = str(tmpdir.join('data'))
+    io_.dump(data, path)
+    assert io_.load(path) == data
+
+    with pytest.raises(TypeError):
+        registry.register_serializer('marshal2', extension='marshal2', serializer=marshal.dumps)
+
+
+def test_json_nan_and_big_ints(tmpdir):
+    import math
+    data = dict(nan=float('nan'), big=2 ** 70)
+    io_ = FlexiblePersist('json')
+    assert io_.extension == '.json'
+    assert 'NaN' in io_.dumps(data)
+
+    path = str(tmpdir.join('data.json'))
+    io_.dump(data, path)
+    for loaded in io_.loads(io_.dumps(data)), io_.load(path):
+        assert math.isnan(loaded['nan'])
+        assert loaded['big'] == 2 ** 70
+
+
+def test_orjson_is_separate_serialization(data, tmpdir):
+    pytest.importorskip('orjson')
+    io_ = FlexiblePersist('orjson')
+    assert isinstance(io_.dumps(data), bytes)
+    assert io_.loads(io_.dumps(data)) == data
+    path = str(tmpdir.join('data' + io_.extension))
+    io_.dump(data, path)
+    assert io_.load(path) == data
+    assert DefaultIORegistry.serialization_from_extension('.json') == 'json'
+
+
+@pytest.mark.parametrize('compression', [None, 'lz4'])
+def test_msgpack_ndarray(compression, tmpdir):
+    np = pytest.importorskip('numpy')
+    data = dict(a=np.arange(12, dtype='>i4').reshape(3, 4), b=[np.linspace(0, 1, 5)[::2], 'x'],
+                c=np.array(3 + 4j), d=np.zeros((0, 2), dtype=bool))
+    io_ = FlexiblePersist('msgpack', compression=compression)
+    path = str(tmpdir.join('data'))
+    io_.dump(data, path)
+
+    for loaded in io_.loads(io_.dumps(data)), io_.load(path):
+        assert sorted(loaded) == sorted(data)
+        for expected, actual in [(data['a'], loaded['a']), (data['b'][0], loaded['b'][0]),
+                                 (data['c'], loaded['c']), (data['d'], loaded['d'])]:
+            assert actual.dtype == expected.dtype
+            assert actual.shape == expected.shape
+            assert (actual == expected).all()
+
+    structured = np.zeros(3, dtype=[('x', '<i4'), ('y', '<f8')])
+    with pytest.raises(TypeError):
+        io_.dumps(dict(s=structured))
+
+
+def test_load_stream_from_dir_skips_other_files(tmpdir):
+    io_ = FlexiblePersist('pickle')
+    dir_ = str(tmpdir.join('stream'))
+    io_.dump_stream_to_dir(['a', 'b', 'c'], dir_, prefix='part-')
+    io_.dump_keyed_stream_to_dir([('x', 1), ('y', 2)], dir_, prefix='kv-')
+    for name in ['part-1x.pkl', 'part-.pkl', 'part-2.json', 'other-3.pkl']:
+        tmpdir.join('stream', name).write('')
+
+    assert list(io_.load_stream_from_dir(dir_, prefix='part-')) == ['a', 'b', 'c']
+    assert dict(io_.load_keyed_stream_from_dir(dir_, prefix='kv-')) == dict(x=1, y=2)
+
+
+@pytest.mark.parametrize('ext', ['.json', '.pkl', '.pkl.gzip'])
+def test_io_buffer_size(data, ext, tmpdir):
+    # smaller than the payload, so that the buffer is flushed and refilled
+    io_ = FlexiblePersist.from_extension(ext, io_buffer_size=16)
+    assert io_._io_buffer_size == 16
+    path = str(tmpdir.join('data' + ext))
+    io_.dump(data, path)
+    assert os.path.getsize(path) > 16
+    assert io_.load(path) == data
+    assert FlexiblePersist.from_extension(ext).load(path) == data
+    with pytest.raises(TypeError):
+        FlexiblePersist.from_extension(ext, None, None, None, None, DefaultIORegistry, 16)
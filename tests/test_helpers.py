@@ -0,0 +1,177 @@
+#coding:utf-8
+import os
+import ast
+import threading
+import pytest
+from bourbaki.ioutils.helpers import maybe_load
+from bourbaki.ioutils.pickleutils import pickle_dump
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Counter:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return dict(args=list(args), kwargs=kwargs)
+
+
+@pytest.fixture
+def path(tmpdir):
+    return str(tmpdir.join('obj.pkl'))
+
+
+def test_maybe_load_computes_then_loads(path):
+    f = Counter()
+    obj = maybe_load(path, f, args=(1, 2), kwargs=dict(x=3))
+    assert os.path.exists(path)
+    assert maybe_load(path, f, args=(1, 2), kwargs=dict(x=3)) == obj
+    assert f.calls == 1
+
+    maybe_load(path, f, recompute=True)
+    assert f.calls == 2
+
+
+def test_maybe_load_memoize(path):
+    f = Counter()
+    obj = maybe_load(path, f, memoize=True)
+    assert maybe_load(path, f, memoize=True) is obj
+    assert maybe_load(path, f) is not obj
+
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    reloaded = maybe_load(path, f, memoize=True)
+    assert reloaded == obj and reloaded is not obj
+    assert f.calls == 1
+
+
+def test_maybe_load_dump_failure(tmpdir):
+    path = str(tmpdir.join('missing_dir', 'obj.pkl'))
+    obj = maybe_load(path, lambda: [1, 2])
+    assert obj == [1, 2]
+    assert not os.path.exists(path)
+
+
+def test_maybe_load_failed_dump_keeps_existing_file(path):
+    maybe_load(path, lambda: "old")
+
+    def bad_dumper(obj, path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+            raise TypeError("can't pickle")
+
+    assert maybe_load(path, lambda: "new", recompute=True, dumper=bad_dumper) == "new"
+    assert maybe_load(path, lambda: "unused") == "old"
+    assert os.listdir(os.path.dirname(path)) == ['obj.pkl']
+
+
+def test_maybe_load_with_sidecar(path):
+    from bourbaki.ioutils import pickle_dump_with_sidecar, pickle_load_with_sidecar
+    np = pytest.importorskip("numpy")
+    f = lambda: dict(a=np.arange(1000.0))
+    kw = dict(loader=pickle_load_with_sidecar, dumper=pickle_dump_with_sidecar)
+
+    obj = maybe_load(path, f, **kw)
+    assert sorted(os.listdir(os.path.dirname(path))) == ['obj.pkl', 'obj.pkl.buffers']
+    loaded = maybe_load(path, lambda: None, **kw)
+    assert (loaded['a'] == obj['a']).all()
+    assert os.path.getsize(path) < obj['a'].nbytes
+
+
+def test_maybe_load_newer_than(path, tmpdir):
+    f = Counter()
+    maybe_load(path, f)
+    mtime = os.stat(path).st_mtime
+
+    source = str(tmpdir.join('source.csv'))
+    with open(source, 'w'):
+        pass
+    os.utime(source, (mtime - 10, mtime - 10))
+    maybe_load(path, f, newer_than=source)
+    maybe_load(path, f, newer_than=mtime - 1)
+    assert f.calls == 1
+
+    os.utime(source, (mtime + 10, mtime + 10))
+    maybe_load(path, f, newer_than=source)
+    assert f.calls == 2
+
+
+def test_maybe_load_dumper_appending_extension(tmpdir):
+    path = str(tmpdir.join('obj.npy'))
+
+    def dumper(obj, path):
+        # like numpy.save, append the extension if it's missing
+        if not path.endswith('.npy'):
+            path += '.npy'
+        with open(path, 'w') as f:
+            f.write(repr(obj))
+
+    def loader(path):
+        with open(path) as f:
+            return ast.literal_eval(f.read())
+
+    f = Counter()
+    obj = maybe_load(path, f, loader=loader, dumper=dumper)
+    assert maybe_load(path, f, loader=loader, dumper=dumper) == obj
+    assert f.calls == 1
+    assert os.listdir(str(tmpdir)) == ['obj.npy']
+
+
+def test_maybe_load_missing_output_moves_nothing(tmpdir):
+    from bourbaki.ioutils.pickleutils import SIDECAR_SUFFIX
+    path = str(tmpdir.join('obj.pkl'))
+
+    def dumper(obj, path):
+        # writes only a sidecar, to the wrong main path
+        with open(path + SIDECAR_SUFFIX, 'wb'):
+            pass
+        with open(path + '.other', 'wb'):
+            pass
+
+    maybe_load(path, lambda: 1, dumper=dumper)
+    tmp_name = '.obj.{}.{}.tmp.pkl.other'.format(os.getpid(), threading.get_ident())
+    assert sorted(os.listdir(str(tmpdir))) == [tmp_name]
+
+
+def test_maybe_load_newer_than_missing_reference(path, tmpdir):
+    maybe_load(path, Counter())
+    missing = str(tmpdir.join('missing.csv'))
+    with pytest.raises(ValueError, match='missing.csv'):
+        maybe_load(path, Counter(), newer_than=missing)
+
+
+def test_maybe_load_returns_obj_on_recursion_error(path):
+    nested = []
+    for _ in range(100000):
+        nested = [nested]
+    assert maybe_load(path, lambda: nested) is nested
+    assert not os.path.exists(path)
+
+
+def test_maybe_load_unhandled_dump_error_cleans_up(tmpdir):
+    path = str(tmpdir.join('obj.pkl'))
+
+    def dumper(obj, path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise ValueError("bug in the dumper")
+
+    with pytest.raises(ValueError):
+        maybe_load(path, lambda: 1, dumper=dumper)
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_maybe_load_concurrent_threads(path):
+    def dumper(obj, path):
+        with open(path, 'wb') as f:
+            f.write(b'x' * 100000)
+        with open(path, 'rb') as f:
+            assert f.read() == b'x' * 100000
+        pickle_dump(obj, path)
+
+    with ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda i: maybe_load(path, lambda: i, dumper=dumper, recompute=True),
+                                    range(32)))
+    assert results == list(range(32))
+    assert os.listdir(os.path.dirname(path)) == ['obj.pkl']
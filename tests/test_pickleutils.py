@@ -6,7 +6,8 @@ import pytest
 from warnings import warn
 import pickle
 _pickle_dump, _pickle_load = pickle.dump, pickle.load
-from bourbaki.ioutils import pickle
+from bourbaki.ioutils import PartiallyPicklable
+from bourbaki.ioutils.pickleutils import pickle_dump as dump, pickle_load as load
 
 BIG_FILE_SIZE = 2**31 + 1
 
@@ -41,13 +42,13 @@ def big_obj():
 
 @pytest.mark.big_io
 def test_save_big_pickle(pickle_save_file, big_obj):
-    pickle.dump(big_obj, pickle_save_file)
+    dump(big_obj, pickle_save_file)
     assert os.stat(pickle_save_file.name).st_size >= BIG_FILE_SIZE
 
 
 @pytest.mark.big_io
 def test_load_big_pickle(pickle_load_file, big_obj):
-    big_obj_ = pickle.load(pickle_load_file)
+    big_obj_ = load(pickle_load_file)
     assert big_obj == big_obj_
     assert os.stat(pickle_load_file.name).st_size >= BIG_FILE_SIZE
 
@@ -63,3 +64,258 @@ def test_pickle_save_fails(pickle_save_file, big_obj):
 # def test_pickle_load_fails(pickle_load_file):
 #     with pytest.raises(OSError):
 #         big_obj_ = _pickle_load(pickle_load_file)
+
+
+def test_pickle_with_sidecar(tmpdir):
+    from bourbaki.ioutils import pickle_dump_with_sidecar, pickle_load_with_sidecar
+    np = pytest.importorskip("numpy")
+    path = str(tmpdir.join("obj.pkl"))
+    obj = dict(a=np.arange(1000.0), b=[np.ones((3, 4), dtype=np.int8), "c"], d=np.arange(10)[::2])
+
+    pickle_dump_with_sidecar(obj, path)
+    assert os.path.getsize(path) < obj["a"].nbytes
+    loaded = pickle_load_with_sidecar(path)
+
+    assert (loaded["a"] == obj["a"]).all()
+    assert (loaded["b"][0] == obj["b"][0]).all() and loaded["b"][1] == "c"
+    assert (loaded["d"] == obj["d"]).all()
+    loaded["a"][0] = -1.0
+    assert pickle_load_with_sidecar(path)["a"][0] == 0.0
+
+
+@pytest.mark.parametrize("n", [0, 7, 16, 33])
+def test_macos_file_chunked_io(n, monkeypatch):
+    from io import BytesIO
+    from bourbaki.ioutils import pickleutils
+    monkeypatch.setattr(pickleutils, "MAX_IO_CHUNK", 8)
+    data = bytes(range(n))
+
+    f = BytesIO()
+    assert pickleutils.MacOSFile(f).write(data) == n
+    assert f.getvalue() == data
+
+    f.seek(0)
+    assert pickleutils.MacOSFile(f).read(n + 5) == data
+    f.seek(0)
+    assert pickleutils.MacOSFile(f).read() == data
+
+
+def test_pickle_raw_file_position(tmpdir):
+    from bourbaki.ioutils import pickle_dump, pickle_load
+    path = str(tmpdir.join("objs.pkl"))
+    objs = [dict(a=list(range(100))), "b", None]
+
+    with open(path, "wb", buffering=0) as f:
+        for obj in objs:
+            pickle_dump(obj, f)
+    with open(path, "rb", buffering=0) as f:
+        assert [pickle_load(f) for _ in objs] == objs
+        assert f.read() == b""
+
+
+class _Partial(PartiallyPicklable):
+    _unpicklable_attrs = ("big", ("other", list))
+
+    def __init__(self):
+        self.small = 1
+        self.big = bytes(100)
+        self.other = [1, 2]
+
+
+def test_partially_picklable_state(tmpdir):
+    obj = _Partial()
+    assert obj.__getstate__() == dict(small=1)
+    assert obj.__dict__.keys() == {"small", "big", "other"}
+
+    path, big, other = (str(tmpdir.join(name)) for name in ("obj.pkl", "big.pkl", "other.pkl"))
+    obj.to_pickles(path, big=big, other=other)
+    loaded = _Partial.from_pickles(path, big=big, other=other)
+    assert loaded.__dict__ == obj.__dict__
+
+
+def test_partially_picklable_attr_specs():
+    class Minimal(_Partial):
+        _minimal_state_attrs = ("other",)
+
+    assert PartiallyPicklable.unpicklable_attrs() == []
+    assert _Partial.unpicklable_types() == [("big", None), ("other", list)]
+    assert _Partial.minimial_state_attrs() == ["big", "other"]
+    assert Minimal.minimial_state_attrs() == ["other"]
+    assert Minimal.minimal_state_types() == [("other", list)]
+
+    attrs = _Partial.unpicklable_attrs()
+    attrs.append("x")
+    assert _Partial.unpicklable_attrs() == ["big", "other"]
+
+
+def test_macos_file_readinto(monkeypatch):
+    from io import BytesIO
+    from bourbaki.ioutils import pickleutils
+    monkeypatch.setattr(pickleutils, "MAX_IO_CHUNK", 8)
+    data = bytes(range(20))
+    f = pickleutils.MacOSFile(BytesIO(data))
+    assert f.readable() and f.seekable()
+
+    buf = bytearray(30)
+    assert f.readinto(buf) == 20
+    assert buf[:20] == data
+
+    f.seek(0)
+    assert f.read1() == data[:8]
+    assert f.readinto1(buf) == 8
+    assert f.tell() == 16
+    assert pickleutils.pickle_load(pickleutils.MacOSFile(BytesIO(pickle.dumps(data)))) == data
+
+
+def test_partially_picklable_mixed_files(tmpdir):
+    obj = _Partial()
+    path, big = (str(tmpdir.join(name)) for name in ("obj.pkl", "big.pkl"))
+    with open(str(tmpdir.join("other.pkl")), "wb") as other:
+        obj.to_pickles(path, big=big, other=other)
+    with open(str(tmpdir.join("other.pkl")), "rb") as other:
+        loaded = _Partial.from_pickles(path, big=big, other=other)
+    assert loaded.__dict__ == obj.__dict__
+
+    with pytest.raises(TypeError):
+        _Partial.from_pickles(path, big=big, other=big)
+
+
+def test_partially_picklable_shared_file(tmpdir):
+    obj = _Partial()
+    path, attrs_path = str(tmpdir.join("obj.pkl")), str(tmpdir.join("attrs.pkl"))
+    with open(attrs_path, "wb") as f:
+        obj.to_pickles(path, big=f, other=f)
+    with open(attrs_path, "rb") as f:
+        loaded = _Partial.from_pickles(path, big=f, other=f)
+    assert loaded.__dict__ == obj.__dict__
+
+    obj.other = lambda: None
+    with pytest.raises((pickle.PicklingError, AttributeError)):
+        obj.to_pickles(path, big=attrs_path, other=str(tmpdir.join("other.pkl")))
+
+
+def test_macos_file_readline():
+    from io import BytesIO
+    from bourbaki.ioutils import pickleutils
+    f = pickleutils.MacOSFile(BytesIO(b"ab\ncd"))
+    assert f.readline() == b"ab\n"
+    assert f.readline() == b"cd"
+    assert load(pickleutils.MacOSFile(BytesIO(pickle.dumps([1, "a"], protocol=0)))) == [1, "a"]
+
+
+def test_pickle_path(tmpdir):
+    from pathlib import Path
+    path = Path(str(tmpdir.join("obj.pkl")))
+    dump({"a": 1}, path)
+    assert load(path) == load(str(path)) == {"a": 1}
+
+
+def test_macos_file_short_writes():
+    from io import BytesIO
+    from bourbaki.ioutils import pickleutils
+
+    class ShortWriter(BytesIO):
+        def write(self, b):
+            return super().write(bytes(b[:3]))
+
+    f = ShortWriter()
+    assert pickleutils.MacOSFile(f).write(bytes(range(10))) == 10
+    assert f.getvalue() == bytes(range(10))
+
+    class BlockingWriter(BytesIO):
+        # a non-blocking raw file that accepts 4 bytes, then would block
+        def write(self, b):
+            if self.tell() >= 4:
+                return None
+            return super().write(bytes(b[:4]))
+
+    f = BlockingWriter()
+    with pytest.raises(BlockingIOError) as e:
+        pickleutils.MacOSFile(f).write(bytes(range(10)))
+    assert e.value.characters_written == 4
+    assert f.getvalue() == bytes(range(4))
+
+
+@pytest.mark.parametrize("compression", ["gzip", "bz2", "lzma", "zstd"])
+def test_pickle_compression(tmpdir, compression):
+    from bourbaki.ioutils.compression import FILE_COMPRESSORS
+    if compression not in FILE_COMPRESSORS:
+        pytest.skip("{} is not installed".format(compression))
+    obj = _Partial()
+    obj.big = bytes(10000)
+    path, big, other = (str(tmpdir.join(name)) for name in ("obj.pkl", "big.pkl", "other.pkl"))
+
+    dump(obj.big, big, compression=compression)
+    assert os.path.getsize(big) < len(obj.big)
+    assert load(big, compression=compression) == obj.big
+
+    # the text-based protocols read line by line
+    for protocol in (0, 2):
+        dump(obj.__dict__, path, protocol=protocol, compression=compression)
+        assert load(path, compression=compression) == obj.__dict__
+
+    obj.to_pickles(path, _compression=compression, big=big, other=other)
+    assert os.path.getsize(big) < len(obj.big)
+    loaded = _Partial.from_pickles(path, _compression=compression, big=big, other=other)
+    assert loaded.__dict__ == obj.__dict__
+
+    with pytest.raises(ValueError):
+        dump(obj, path, compression="nope")
+    with pytest.raises(ValueError):
+        # written in the frame format, but the legacy block format can't be read by a frame reader
+        dump(obj, path, compression="lz4")
+
+
+class _Compression(PartiallyPicklable):
+    _unpicklable_attrs = ("compression",)
+
+    def __init__(self):
+        self.compression = "zstd"
+
+
+def test_partially_picklable_attr_named_compression(tmpdir):
+    obj = _Compression()
+    path, attr_path = str(tmpdir.join("obj.pkl")), str(tmpdir.join("compression.pkl"))
+    obj.to_pickles(path, compression=attr_path)
+    assert load(attr_path) == "zstd"
+    assert _Compression.from_pickles(path, compression=attr_path).compression == "zstd"
+
+
+class _Overridden(_Partial):
+    @classmethod
+    def unpicklable_attrs(cls):
+        return ["big"]
+
+    @classmethod
+    def minimial_state_attrs(cls):
+        return ["big"]
+
+
+def test_partially_picklable_overridden_classmethods(tmpdir, caplog):
+    obj = _Overridden()
+    assert obj.__getstate__() == dict(small=1, other=[1, 2])
+
+    path, big = str(tmpdir.join("obj.pkl")), str(tmpdir.join("big.pkl"))
+    obj.to_pickles(path, big=big)
+    loaded = _Overridden.from_pickles(path, big=big)
+    assert loaded.__dict__ == obj.__dict__
+    assert not [r for r in caplog.records if "were not passed" in r.getMessage()]
+
+
+def test_pickle_without_oob_keywords(tmpdir, monkeypatch):
+    # before python 3.8, pickle.dump/load don't accept buffer_callback/buffers
+    from bourbaki.ioutils import pickleutils
+
+    def old_dump(obj, file, protocol=None):
+        return _pickle_dump(obj, file, protocol=protocol)
+
+    def old_load(file):
+        return _pickle_load(file)
+
+    monkeypatch.setattr(pickleutils, "_pickle_dump", old_dump)
+    monkeypatch.setattr(pickleutils, "_pickle_load", old_load)
+    path = str(tmpdir.join("obj.pkl"))
+    dump([1, "a"], path)
+    assert load(path) == [1, "a"]
+    dump([1, "a"], path, compression="gzip")
+    assert load(path, compression="gzip") == [1, "a"]